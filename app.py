@@ -1,77 +1,286 @@
-from flask import Flask, render_template, request, session, redirect, url_for, send_from_directory, make_response
+from flask import Flask, render_template, request, session, redirect, url_for, send_from_directory, send_file
+from werkzeug.security import safe_join
 import googlemaps
+import diskcache
+import minify_html
 import polyline
 import folium
 from datetime import datetime, timedelta
 from flask_session import Session
 from branca.element import Template, MacroElement
+from folium.utilities import JsCode
+from jinja2 import FileSystemBytecodeCache
+from scipy.spatial import cKDTree
 import os
 import pandas as pd
 import json
+import orjson
+import gzip
+import io
 import glob
 from uuid import uuid4
-import math
 import numpy as np
-from geopy.distance import geodesic
 import time
 import random
+import re
+import string
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from geo_kernels import EARTH_RADIUS_M, MAX_SPEED_LIMIT, bearings_and_turns, compute_speeds, haversine_m, proximity_within, rdp_mask, route_geom, to_cartesian_m
+
+class SessionCache(diskcache.Cache):
+    """
+    diskcache store for server-side sessions.
+    flask_session's cachelib backend passes the lifetime as timeout=, which diskcache calls expire.
+    """
+    def set(self, key, value, timeout=None, **kwargs):
+        if timeout:
+            kwargs.setdefault('expire', timeout)
+        return super().set(key, value, **kwargs)
 
 # Use this to configure your Flask app
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'
-app.config['SESSION_TYPE'] = 'filesystem'
+SESSION_DIR = '.sessions'
+app.config['SESSION_TYPE'] = 'cachelib'
+app.config['SESSION_CACHELIB'] = SessionCache(SESSION_DIR)
 Session(app)
 
+# Keep compiled templates on disk so they are parsed once, not per process
+JINJA_CACHE_DIR = '.jinja_cache'
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory=JINJA_CACHE_DIR)
+
 API_KEY = os.environ.get("API_KEY") 
-gmaps = googlemaps.Client(key=API_KEY)
+gmaps = googlemaps.Client(key=API_KEY, timeout=10)
+
+# Google responses are memoized on disk so repeat analyses skip the network and the quota
+API_CACHE_DIR = '.api_cache'
+api_cache = diskcache.Cache(API_CACHE_DIR)
+
+# Fetched routes live server-side; the session only carries the token that points at them
+ROUTE_STORE_DIR = '.route_store'
+ROUTE_STORE_TTL = 30 * 60  # seconds
+route_store = diskcache.Cache(ROUTE_STORE_DIR)
 
 TRUCK_WEIGHT = 37.5  # tonnes
-MAX_SPEED_LIMIT = 60  # kmph
+RDP_EPSILON_DEG = 1e-4  # ~11 m; simplification tolerance for truck marker placement
+TRUCK_MARKER_STRIDE = 50  # route points per truck marker at most, the density of the original every-50th-point markers
+ROUTE_LINE_EPSILON_DEG = 5e-5  # ~5 m; below a pixel at the map's zoom, so the drawn line looks the same
+SIMPLIFY_EPSILON_M = 5.0  # tolerance for simplifying the decoded polyline before analysis
+TRAFFIC_LEVELS = ('light', 'moderate', 'heavy')
+TRAFFIC_COLORS = {'light': 'green', 'moderate': 'orange', 'heavy': 'red'}
+POI_KEYWORDS = ('hospital', 'police', 'fuel', 'school')
+TURN_RE = re.compile(r'^[^\n]*?turn', re.IGNORECASE | re.MULTILINE)  # matches once per line that mentions a turn
+PLACES_WORKERS = 16  # Places lookups are I/O bound, so they run concurrently
+
+# POIs are kept as parallel arrays with the type encoded as POI_KEYWORDS index
+POIStore = namedtuple('POIStore', 'lat lng type_id names')
+TYPE_ID = {poi_type: type_id for type_id, poi_type in enumerate(POI_KEYWORDS)}
+
+# Simulated traffic samples, with the level encoded as TRAFFIC_LEVELS index
+TrafficStore = namedtuple('TrafficStore', 'lat lng level_code delay_factor')
+TRAFFIC_RISK_FACTORS = np.array([0.1, 0.5, 1.0])  # per TRAFFIC_LEVELS entry
+TRAFFIC_LEVEL_BINS = [1.25, 1.75]  # delay factors at which traffic becomes moderate and heavy
+
+# Packed record layout for risk zones
+RISK_DTYPE = np.dtype([('lat', 'f8'), ('lng', 'f8'), ('risk_score', 'f8'), ('risk_level', 'U6'), ('risk_factors', 'O')])
+
+# Map legend; built from constants, so it is compiled once at import
+LEGEND_HTML = f"""
+{{% macro html(this, kwargs) %}}
+<div style="
+    position: fixed;
+    bottom: 50px;
+    left: 50px;
+    width: 280px;
+    background-color: white;
+    border: 2px solid grey;
+    border-radius: 8px;
+    z-index: 9999;
+    padding: 15px;
+    font-size: 12px;
+    box-shadow: 0 4px 8px rgba(0,0,0,0.1);
+">
+    <h4 style='margin-top: 0; color: #333;'>🚛 Truck Navigation Legend</h4>
+    <div style='margin: 5px 0;'><i class="fa fa-plus fa-lg" style="color:red"></i> Hospital</div>
+    <div style='margin: 5px 0;'><i class="fa fa-shield fa-lg" style="color:blue"></i> Police</div>
+    <div style='margin: 5px 0;'><i class="fa fa-gas-pump fa-lg" style="color:orange"></i> Fuel Station</div>
+    <div style='margin: 5px 0;'>🔴 High Risk Zone</div>
+    <div style='margin: 5px 0;'>🟡 Medium Risk Zone</div>
+    <div style='margin: 5px 0;'>● Traffic: <span style='color: green;'>Light</span> <span style='color: orange;'>Moderate</span> <span style='color: red;'>Heavy</span></div>
+    <hr style='margin: 10px 0;'>
+    <div style='font-size: 10px; color: #666;'>
+        Max Weight: {TRUCK_WEIGHT}T | Speed Limit: {MAX_SPEED_LIMIT} km/h
+    </div>
+</div>
+{{% endmacro %}}
+"""
+LEGEND_TEMPLATE = Template(LEGEND_HTML)
+
+# Route polyline drawn from pre-serialized coordinates, bypassing folium's per-point validation
+ROUTE_LINE_TEMPLATE = Template("""
+{% macro script(this, kwargs) %}
+L.polyline({{ this.locations_json }}, {color: 'blue', weight: 4, opacity: 0.8}).addTo({{ this._parent.get_name() }});
+{% endmacro %}
+""")
+
+# Leaflet pointToLayer factories for the GeoJSON overlays built in analyze_route
+TRUCK_MARKER_JS = JsCode("""
+function(feature, latlng) {
+    var html = feature.properties.html;
+    var icon = L.divIcon({html: html, iconSize: [60, 60], iconAnchor: [30, 30], className: 'empty'});
+    return L.marker(latlng, {icon: icon}).bindPopup(html);
+}
+""")
+POI_MARKER_JS = JsCode("""
+function(feature, latlng) {
+    var p = feature.properties;
+    var icon = L.AwesomeMarkers.icon({icon: p.icon, markerColor: p.color, iconColor: 'white', prefix: 'fa'});
+    return L.marker(latlng, {icon: icon}).bindPopup(p.popup);
+}
+""")
+RISK_ZONE_JS = JsCode("""
+function(feature, latlng) {
+    var p = feature.properties;
+    return L.circleMarker(latlng, {radius: 15, color: p.color, fillColor: p.color, fillOpacity: 0.4})
+        .bindPopup(p.popup, {maxWidth: 250});
+}
+""")
+TRAFFIC_MARKER_JS = JsCode("""
+function(feature, latlng) {
+    var p = feature.properties;
+    return L.circle(latlng, {radius: 100, color: p.color, fill: true, fillColor: p.color, fillOpacity: 0.2})
+        .bindPopup(p.popup);
+}
+""")
+
+# Per-marker HTML for analyze_route, parsed once here and filled with substitute()
+TRUCK_HTML = string.Template("""
+<div style='text-align: center; font-family: Arial;'>
+    <div style='font-size: 20px;'>🚛</div>
+    <div style='background-color: $color;
+                color: white; padding: 2px 5px; border-radius: 3px; font-weight: bold;'>
+        $speed km/h
+    </div>
+    <div style='font-size: 10px; margin-top: 2px;'>
+        Turn: $turn°
+    </div>
+</div>
+""")
+RISK_POPUP_HTML = string.Template("""
+<div style='font-family: Arial; max-width: 200px;'>
+    <h4 style='color: $color;'>⚠️ $level Risk Zone</h4>
+    <p><b>Risk Score:</b> $score/10</p>
+    <p><b>Factors:</b><br>$factors</p>
+</div>
+""")
+
+def save_map(m, html_name):
+    """
+    Writes a folium map to templates/<html_name>.gz as minified, gzipped HTML.
+    view_map, download_map and view_preview serve the compressed file as-is.
+    """
+    html = minify_html.minify(m.get_root().render(), minify_css=True, minify_js=True)
+    with gzip.open(os.path.join("templates", html_name + ".gz"), 'wb') as f:
+        f.write(html.encode('utf-8'))
 
-def calculate_bearing(lat1, lng1, lat2, lng2):
+def send_map(filename, as_attachment=False):
     """
-    Calculates the bearing between two points using the Haversine formula.
-    This provides a more accurate value for navigation.
+    Sends a map saved by save_map, gzipped as stored or as plain HTML to clients that don't accept gzip.
     """
-    try:
-        lat1, lng1, lat2, lng2 = map(math.radians, [lat1, lng1, lat2, lng2])
-        dlng = lng2 - lng1
-        y = math.sin(dlng) * math.cos(lat2)
-        x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dlng)
-        bearing = math.atan2(y, x)
-        return (math.degrees(bearing) + 360) % 360
-    except (ValueError, TypeError, ZeroDivisionError) as e:
-        print(f"Error in calculate_bearing: {e}")
-        return 0
-
-def calculate_turn_angle(prev_bearing, curr_bearing):
+    # Every saved map gets a fresh uuid in its filename and is never rewritten, so the name identifies the content
+    if request.accept_encodings['gzip'] > 0:
+        response = send_from_directory(
+            directory='templates', path=filename + ".gz",
+            mimetype='text/html', as_attachment=as_attachment, download_name=filename, etag=filename + "-gzip"
+        )
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        with gzip.open(safe_join('templates', filename + ".gz"), 'rb') as f:
+            html = f.read()
+        response = send_file(
+            io.BytesIO(html),
+            mimetype='text/html', as_attachment=as_attachment, download_name=filename, etag=filename
+        )
+    response.vary.add('Accept-Encoding')
+    return response
+
+def route_line(coords):
+    """Builds a map element drawing coords as the route polyline."""
+    line = MacroElement()
+    line._template = ROUTE_LINE_TEMPLATE
+    line.locations_json = orjson.dumps(coords, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return line
+
+def point_features(rows):
+    """Builds a GeoJSON FeatureCollection of points from (lat, lng, properties) rows."""
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [float(lng), float(lat)]}, 'properties': properties}
+            for lat, lng, properties in rows
+        ]
+    }
+
+@api_cache.memoize(expire=15 * 60)
+def cached_directions(source_coords, dest_coords, mode):
     """
-    Calculates the turn angle (in degrees) from one bearing to the next.
-    The result is always between 0 and 180 degrees.
+    Fetches alternative routes from Google Directions.
+    Cached briefly so the traffic-aware durations stay current.
     """
-    try:
-        angle = abs(curr_bearing - prev_bearing)
-        return min(angle, 360 - angle)
-    except (ValueError, TypeError) as e:
-        print(f"Error in calculate_turn_angle: {e}")
-        return 0
+    return gmaps.directions(
+        source_coords, dest_coords,
+        mode=mode,
+        alternatives=True,
+        departure_time=datetime.now()
+    )
+
+def prune_route(route):
+    """
+    Keeps only the parts of a Directions route that the app reads, in the same nested layout.
+    This is what goes into route_store, so each analysis unpickles a small entry.
+    """
+    leg = route['legs'][0]
+    pruned = {
+        'overview_polyline': {'points': route['overview_polyline']['points']},
+        'legs': [{
+            'distance': {'text': leg['distance']['text']},
+            'duration': {'text': leg['duration']['text']},
+            'steps': [
+                {'html_instructions': step.get('html_instructions', ''), 'distance': {'text': step['distance']['text']}}
+                for step in leg['steps']
+            ]
+        }]
+    }
+    if 'summary' in route:
+        pruned['summary'] = route['summary']
+    return pruned
+
+@api_cache.memoize(expire=24 * 60 * 60)
+def _cached_places(lat, lng, radius, keyword):
+    return gmaps.places_nearby(location=(lat, lng), radius=radius, keyword=keyword)
 
-def get_recommended_speed(turn_angle, road_type="urban"):
+def cached_places(lat, lng, radius, keyword):
     """
-    Calculates a recommended speed based on the turn angle.
-    This is a heuristic model, not a physical simulation.
+    Google Places nearby search, cached for a day.
+    The location is rounded to 4 decimals (~11 m) so nearby lookups share entries.
     """
-    try:
-        if turn_angle > 90:
-            return 10
-        elif turn_angle > 45:
-            return 20
-        elif turn_angle > 20:
-            return 35
-        else:
-            return MAX_SPEED_LIMIT
-    except:
-        return 40
+    return _cached_places(round(lat, 4), round(lng, 4), radius, keyword)
+
+def simplify_route(coords, epsilon_m=SIMPLIFY_EPSILON_M):
+    """
+    Douglas-Peucker simplification of a decoded polyline with a tolerance in meters.
+    Distances are measured in a local equirectangular projection around the first point.
+    """
+    if len(coords) < 3:
+        return coords
+
+    points = np.asarray(coords, dtype=np.float64)
+    projected = np.radians(points) * EARTH_RADIUS_M
+    projected[:, 1] *= np.cos(np.radians(points[0, 0]))
+    keep = rdp_mask(projected, epsilon_m)
+    return list(zip(points[keep, 0].tolist(), points[keep, 1].tolist()))
 
 def interpolate_route_points(coords, points_per_km=10):
     """
@@ -80,25 +289,26 @@ def interpolate_route_points(coords, points_per_km=10):
     """
     if len(coords) < 2:
         return coords
-    
+
     try:
-        interpolated = [coords[0]]
-        for i in range(1, len(coords)):
-            start = coords[i-1]
-            end = coords[i]
-            distance_km = geodesic(start, end).kilometers
-            
-            if distance_km > 0.1:  # Only interpolate if segment is long enough
-                num_points = int(distance_km * points_per_km)
-                for j in range(1, num_points):
-                    ratio = j / num_points
-                    lat = start[0] + (end[0] - start[0]) * ratio
-                    lng = start[1] + (end[1] - start[1]) * ratio
-                    interpolated.append((lat, lng))
-            
-            interpolated.append(end)
-        
-        return interpolated
+        points = np.asarray(coords, dtype=np.float64)
+        start, end = points[:-1], points[1:]
+        distance_km = haversine_m(start[:, 0], start[:, 1], end[:, 0], end[:, 1]) / 1000
+
+        # Only interpolate if segment is long enough
+        num_points = np.where(distance_km > 0.1, (distance_km * points_per_km).astype(np.int64), 0)
+
+        # Each segment emits its interior points followed by its end point
+        per_segment = np.maximum(num_points, 1)
+        segment = np.repeat(np.arange(len(start)), per_segment)
+        segment_ends = np.cumsum(per_segment)
+        step = np.arange(len(segment)) - np.repeat(segment_ends - per_segment, per_segment) + 1
+        ratio = (step / per_segment[segment])[:, None]
+
+        interpolated = start[segment] + (end[segment] - start[segment]) * ratio
+        interpolated[segment_ends - 1] = end
+        interpolated = np.vstack([points[:1], interpolated])
+        return list(zip(interpolated[:, 0].tolist(), interpolated[:, 1].tolist()))
     except Exception as e:
         print(f"Error in interpolation: {e}")
         return coords
@@ -107,8 +317,8 @@ def get_traffic_data(coords):
     """
     Simulates real-time traffic data with a more refined probabilistic model.
     Uses a normal distribution to introduce realistic variability.
+    Returns the traffic points and a summary with the per-level counts and the average delay factor.
     """
-    traffic_data = []
     current_hour = datetime.now().hour
     
     # Define mean and standard deviation for delay factors based on time of day
@@ -125,31 +335,28 @@ def get_traffic_data(coords):
         mean_delay = 1.1
         std_dev_delay = 0.1
 
-    try:
-        # Sample points to make API calls more efficient
-        sample_coords = coords[::5] if len(coords) > 5 else coords
-        
-        for lat, lng in sample_coords:
-            # Generate a random delay factor from a normal distribution
-            delay_factor = np.random.normal(mean_delay, std_dev_delay)
-            delay_factor = max(1.0, delay_factor) # Ensure delay factor is at least 1.0
-
-            if delay_factor >= 1.75:
-                traffic_level = 'heavy'
-            elif delay_factor >= 1.25:
-                traffic_level = 'moderate'
-            else:
-                traffic_level = 'light'
-
-            traffic_data.append({
-                'location': (lat, lng),
-                'traffic_level': traffic_level,
-                'delay_factor': delay_factor
-            })
-    except Exception as e:
-        print(f"Error getting traffic data: {e}")
-    
-    return traffic_data
+    # Sample points to make API calls more efficient
+    points = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    sample_coords = points[::5] if len(points) > 5 else points
+
+    # A fresh generator per call: no lock shared between request threads and no seed shared by forked workers
+    rng = np.random.default_rng()
+
+    # Draw a delay factor for every sampled point at once from a normal distribution
+    delay_factors = np.maximum(1.0, rng.normal(mean_delay, std_dev_delay, size=len(sample_coords))) # Ensure delay factor is at least 1.0
+    level_code = np.digitize(delay_factors, TRAFFIC_LEVEL_BINS).astype(np.int8)
+
+    traffic_data = TrafficStore(
+        lat=sample_coords[:, 0],
+        lng=sample_coords[:, 1],
+        level_code=level_code,
+        delay_factor=delay_factors
+    )
+    traffic_summary = {
+        'level_counts': dict(zip(TRAFFIC_LEVELS, np.bincount(level_code, minlength=len(TRAFFIC_LEVELS)).tolist())),
+        'average_delay_factor': float(delay_factors.mean()) if len(delay_factors) else 1.0
+    }
+    return traffic_data, traffic_summary
 
 def get_road_type_and_width(html_instructions):
     """
@@ -190,13 +397,25 @@ def get_route_segments(steps):
         })
     return segments
 
+def build_poi_store(pois):
+    """Packs (lat, lng, type, name) rows into a POIStore of parallel arrays."""
+    lat, lng, poi_type, names = zip(*pois) if pois else ((), (), (), ())
+    return POIStore(
+        lat=np.array(lat, dtype=np.float64),
+        lng=np.array(lng, dtype=np.float64),
+        type_id=np.array([TYPE_ID[t] for t in poi_type], dtype=np.int8),
+        names=np.array(names, dtype=object)
+    )
+
 def identify_high_risk_zones(coords, pois, segments, traffic_data):
     """
     Identifies high-risk zones using a weighted, multi-factor model.
     The risk score is now calculated using the user-specified weights.
+    Returns the zones and a Counter of their risk levels.
     """
     risk_zones = []
-    
+    risk_counts = Counter()
+
     # User-specified weights for different risk factors
     weights = {
         'turn_angle': 4,
@@ -208,17 +427,26 @@ def identify_high_risk_zones(coords, pois, segments, traffic_data):
     }
 
     try:
-        poi_locations = {poi['type']: [p['location'] for p in pois if p['type'] == poi['type']] for poi in pois}
+        points = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        geom = route_geom(points)
+        _, turn_angles = bearings_and_turns(geom)
+
+        # POIs within 500 m of every route point, per POI type; the route index is shared by all types
+        route_tree = cKDTree(to_cartesian_m(geom))
+        poi_xyz = to_cartesian_m(route_geom(np.column_stack([pois.lat, pois.lng])))
+        poi_proximity = {
+            poi_type: proximity_within(route_tree, poi_xyz[pois.type_id == TYPE_ID[poi_type]], 500)
+            for poi_type in ('hospital', 'school', 'police')
+        }
 
-        for i in range(1, len(coords) - 1):
-            current_coord = coords[i]
+        traffic_count = len(traffic_data.level_code)
+        accident_prone = np.random.default_rng().random(len(points)) < 0.005
+        for i in range(1, len(points) - 1):
             risk_score = 0
             risk_factors = []
 
             # Factor 1: Turn angle (weighted)
-            prev_bearing = calculate_bearing(coords[i-1][0], coords[i-1][1], current_coord[0], current_coord[1])
-            next_bearing = calculate_bearing(current_coord[0], current_coord[1], coords[i+1][0], coords[i+1][1])
-            turn_angle = calculate_turn_angle(prev_bearing, next_bearing)
+            turn_angle = turn_angles[i]
 
             if turn_angle > 45: # A turn angle over 45 degrees is considered a risk
                 turn_factor = turn_angle / 180  # Normalize to a value between 0 and 1
@@ -226,7 +454,7 @@ def identify_high_risk_zones(coords, pois, segments, traffic_data):
                 risk_factors.append(f"Sharp turn ({turn_angle:.1f}°)")
 
             # Factor 2: Road Width (weighted)
-            segment_index = int(i * len(segments) / len(coords))
+            segment_index = int(i * len(segments) / len(points))
             if segment_index < len(segments):
                 road_width = segments[segment_index]['road_width']
                 if road_width < 7.0: # Roads narrower than 7m are considered risky
@@ -235,36 +463,28 @@ def identify_high_risk_zones(coords, pois, segments, traffic_data):
                     risk_factors.append(f"Narrow road ({road_width:.1f}m)")
 
             # Factor 3: Traffic (weighted)
-            traffic_segment_index = int(i * len(traffic_data) / len(coords))
-            if traffic_segment_index < len(traffic_data):
-                traffic_level = traffic_data[traffic_segment_index]['traffic_level']
-                if traffic_level == 'heavy':
-                    traffic_factor = 1.0
-                elif traffic_level == 'moderate':
-                    traffic_factor = 0.5
-                else:
-                    traffic_factor = 0.1
-                risk_score += weights['traffic'] * traffic_factor
-                risk_factors.append(f"Traffic ({traffic_level.title()})")
+            traffic_segment_index = int(i * traffic_count / len(points))
+            if traffic_segment_index < traffic_count:
+                level_code = traffic_data.level_code[traffic_segment_index]
+                risk_score += weights['traffic'] * TRAFFIC_RISK_FACTORS[level_code]
+                risk_factors.append(f"Traffic ({TRAFFIC_LEVELS[level_code].title()})")
 
             # Factor 4: Proximity to POIs (weighted)
-            for poi_type, locations in poi_locations.items():
-                for poi_loc in locations:
-                    distance = geodesic(current_coord, poi_loc).meters
-                    if distance < 500:
-                        proximity_factor = 1 - (distance / 500)
-                        if poi_type == 'hospital':
-                            risk_score += weights['hospital_proximity'] * proximity_factor
-                            risk_factors.append("Proximity to hospital")
-                        elif poi_type == 'school':
-                            risk_score += weights['school_proximity'] * proximity_factor
-                            risk_factors.append("Proximity to school")
-                        elif poi_type == 'police':
-                            risk_score += weights.get('police_proximity', 2) * proximity_factor # Use default if not specified
-                            risk_factors.append("Proximity to police station")
-                        
+            for poi_type, (counts, closeness) in poi_proximity.items():
+                if counts[i] == 0:
+                    continue
+                if poi_type == 'hospital':
+                    risk_score += weights['hospital_proximity'] * closeness[i]
+                    risk_factors.extend(["Proximity to hospital"] * counts[i])
+                elif poi_type == 'school':
+                    risk_score += weights['school_proximity'] * closeness[i]
+                    risk_factors.extend(["Proximity to school"] * counts[i])
+                elif poi_type == 'police':
+                    risk_score += weights.get('police_proximity', 2) * closeness[i] # Use default if not specified
+                    risk_factors.extend(["Proximity to police station"] * counts[i])
+
             # Factor 5: Simulated high-risk areas (weighted)
-            if random.random() < 0.005:
+            if accident_prone[i]:
                 risk_score += weights['simulated_accident_prone']
                 risk_factors.append("Historically accident-prone zone (simulated)")
 
@@ -279,20 +499,19 @@ def identify_high_risk_zones(coords, pois, segments, traffic_data):
             else:
                 continue
 
-            risk_zones.append({
-                'location': current_coord,
-                'risk_score': min(normalized_score, 10),
-                'risk_factors': risk_factors,
-                'risk_level': risk_level
-            })
-            
+            risk_zones.append((points[i, 0], points[i, 1], min(normalized_score, 10), risk_level, risk_factors))
+            risk_counts[risk_level] += 1
+
     except Exception as e:
         print(f"Error identifying risk zones: {e}")
-    
-    return risk_zones
 
-def generate_route_report(coords, pois, risk_zones, traffic_data, total_distance, total_duration, segments):
-    """Generates a detailed route analysis report."""
+    return np.array(risk_zones, dtype=RISK_DTYPE), risk_counts
+
+def generate_route_report(coords, pois, risk_counts, traffic_summary, total_distance, total_duration, segments):
+    """
+    Generates a detailed route analysis report.
+    Risk and traffic figures come from the summaries built by identify_high_risk_zones and get_traffic_data.
+    """
     try:
         distance_value = 1
         try:
@@ -303,6 +522,9 @@ def generate_route_report(coords, pois, risk_zones, traffic_data, total_distance
         except (ValueError, IndexError):
             distance_value = 1
             
+        poi_counts = np.bincount(pois.type_id, minlength=len(POI_KEYWORDS))
+        traffic_counts = traffic_summary['level_counts']
+
         # Analyze road types
         national_highway_count = sum(1 for s in segments if 'National Highway' in s['road_type'])
         state_highway_count = sum(1 for s in segments if 'State Highway' in s['road_type'])
@@ -328,11 +550,11 @@ def generate_route_report(coords, pois, risk_zones, traffic_data, total_distance
             'route_analysis': {
                 'total_points': len(coords),
                 'points_per_km': len(coords) / distance_value if distance_value > 0 else 0,
-                'high_risk_zones': len([z for z in risk_zones if z['risk_level'] == 'High']),
-                'medium_risk_zones': len([z for z in risk_zones if z['risk_level'] == 'Medium']),
-                'hospitals_along_route': len([p for p in pois if p['type'] == 'hospital']),
-                'fuel_stations': len([p for p in pois if p['type'] == 'fuel']),
-                'police_stations': len([p for p in pois if p['type'] == 'police']),
+                'high_risk_zones': risk_counts['High'],
+                'medium_risk_zones': risk_counts['Medium'],
+                'hospitals_along_route': int(poi_counts[TYPE_ID['hospital']]),
+                'fuel_stations': int(poi_counts[TYPE_ID['fuel']]),
+                'police_stations': int(poi_counts[TYPE_ID['police']]),
                 'national_highway_segments': national_highway_count,
                 'state_highway_segments': state_highway_count,
                 'urban_road_segments': urban_road_count,
@@ -340,14 +562,14 @@ def generate_route_report(coords, pois, risk_zones, traffic_data, total_distance
                 'total_segments': len(segments)
             },
             'traffic_analysis': {
-                'light_traffic_segments': len([t for t in traffic_data if t['traffic_level'] == 'light']),
-                'moderate_traffic_segments': len([t for t in traffic_data if t['traffic_level'] == 'moderate']),
-                'heavy_traffic_segments': len([t for t in traffic_data if t['traffic_level'] == 'heavy']),
-                'average_delay_factor': np.mean([t['delay_factor'] for t in traffic_data]) if traffic_data else 1.0
+                'light_traffic_segments': traffic_counts['light'],
+                'moderate_traffic_segments': traffic_counts['moderate'],
+                'heavy_traffic_segments': traffic_counts['heavy'],
+                'average_delay_factor': traffic_summary['average_delay_factor']
             },
             'safety_recommendations': [
                 f"Maintain speed below {MAX_SPEED_LIMIT} kmph at all times",
-                f"Exercise extreme caution at the {len([z for z in risk_zones if z['risk_level'] == 'High'])} high-risk zones identified.",
+                f"Exercise extreme caution at the {risk_counts['High']} high-risk zones identified.",
                 "Reduce speed to 15-30 kmph at sharp turns and intersections.",
                 "Plan for refueling at the marked IndianOil stations along the route.",
                 "Keep emergency contacts handy for nearby hospitals and police stations."
@@ -389,6 +611,40 @@ def generate_route_report(coords, pois, risk_zones, traffic_data, total_distance
             ]
         }
 
+def load_landmarks():
+    """
+    Reads the IOCL landmarks offered on the route form.
+    Falls back to sample terminals if the spreadsheet is missing.
+    """
+    landmarks = []
+    try:
+        df_iocl = pd.read_excel("IOCL_Landmark_Details.xlsx")
+        for _, row in df_iocl.iterrows():
+            try:
+                lat = float(row['Latitude']) if pd.notna(row['Latitude']) else None
+                lng = float(row['Longitude']) if pd.notna(row['Longitude']) else None
+                name = str(row['Landmark Name']).strip() if pd.notna(row['Landmark Name']) else None
+                if lat is not None and lng is not None and name:
+                    landmarks.append({'name': name, 'lat': lat, 'lng': lng})
+            except (ValueError, TypeError) as e:
+                continue
+    except FileNotFoundError:
+        print("IOCL_Landmark_Details.xlsx not found, using sample landmarks")
+        landmarks = [
+            {'name': 'Delhi Terminal', 'lat': 28.6139, 'lng': 77.2090},
+            {'name': 'Mumbai Terminal', 'lat': 19.0760, 'lng': 72.8777},
+            {'name': 'Bangalore Terminal', 'lat': 12.9716, 'lng': 77.5946},
+            {'name': 'Chennai Terminal', 'lat': 13.0827, 'lng': 80.2707},
+            {'name': 'Kolkata Terminal', 'lat': 22.5726, 'lng': 88.3639}
+        ]
+    except Exception as e:
+        print(f"Error loading Excel file: {e}")
+        landmarks = []
+    return tuple(landmarks)
+
+# The landmark sheet never changes at runtime, so it is parsed once at startup
+LANDMARKS = load_landmarks()
+
 @app.route('/health')
 def health():
     return {"status": "OK", "message": "App is running"}
@@ -400,32 +656,7 @@ def test():
 @app.route('/')
 def home():
     try:
-        landmarks = []
-        try:
-            df_iocl = pd.read_excel("IOCL_Landmark_Details.xlsx")
-            for _, row in df_iocl.iterrows():
-                try:
-                    lat = float(row['Latitude']) if pd.notna(row['Latitude']) else None
-                    lng = float(row['Longitude']) if pd.notna(row['Longitude']) else None
-                    name = str(row['Landmark Name']).strip() if pd.notna(row['Landmark Name']) else None
-                    if lat is not None and lng is not None and name:
-                        landmarks.append({'name': name, 'lat': lat, 'lng': lng})
-                except (ValueError, TypeError) as e:
-                    continue
-        except FileNotFoundError:
-            print("IOCL_Landmark_Details.xlsx not found, using sample landmarks")
-            landmarks = [
-                {'name': 'Delhi Terminal', 'lat': 28.6139, 'lng': 77.2090},
-                {'name': 'Mumbai Terminal', 'lat': 19.0760, 'lng': 72.8777},
-                {'name': 'Bangalore Terminal', 'lat': 12.9716, 'lng': 77.5946},
-                {'name': 'Chennai Terminal', 'lat': 13.0827, 'lng': 80.2707},
-                {'name': 'Kolkata Terminal', 'lat': 22.5726, 'lng': 88.3639}
-            ]
-        except Exception as e:
-            print(f"Error loading Excel file: {e}")
-            landmarks = []
-
-        return render_template("route_form.html", landmarks=landmarks)
+        return render_template("route_form.html", landmarks=LANDMARKS)
     except Exception as e:
         print(f"Error loading data: {e}")
         import traceback
@@ -436,8 +667,8 @@ def home():
 def fetch_routes():
     try:
         session.clear()
-        for f in glob.glob("templates/route_preview_*.html"): os.remove(f)
-        for f in glob.glob("templates/route_map_*.html"): os.remove(f)
+        for f in glob.glob("templates/route_preview_*.html.gz"): os.remove(f)
+        for f in glob.glob("templates/route_map_*.html.gz"): os.remove(f)
 
         source = request.form['source'].strip()
         destination = request.form['destination'].strip()
@@ -449,25 +680,18 @@ def fetch_routes():
         except ValueError:
             return "Invalid coordinates format. Please use: latitude,longitude"
 
-        directions = gmaps.directions(
-            source_coords, dest_coords,
-            mode=vehicle,
-            alternatives=True,
-            departure_time=datetime.now()
-        )
+        directions = cached_directions(source_coords, dest_coords, vehicle)
 
         if not directions:
             return "No routes found between the specified locations."
 
-        session['directions'] = directions
-        session['source'] = source_coords
-        session['destination'] = dest_coords
-        session['vehicle'] = vehicle
-        session.modified = True
-
+        # Routes keep their Google index; one that can't be read stays None and is not offered
+        pruned_routes = [None] * len(directions)
         routes = []
         for i, route in enumerate(directions):
             try:
+                route = prune_route(route)
+                pruned_routes[i] = route
                 coords = polyline.decode(route['overview_polyline']['points'])
                 distance = route['legs'][0]['distance']['text']
                 duration = route['legs'][0]['duration']['text']
@@ -476,8 +700,8 @@ def fetch_routes():
                 unique_id = uuid4().hex
                 preview_file = f"route_preview_{i}_{unique_id}.html"
                 m = folium.Map(location=coords[len(coords)//2], zoom_start=12)
-                folium.PolyLine(coords, color='blue', weight=5).add_to(m)
-                m.save(f"templates/{preview_file}")
+                m.add_child(route_line(coords))
+                save_map(m, preview_file)
 
                 routes.append({
                     'index': i,
@@ -490,6 +714,15 @@ def fetch_routes():
                 print(f"Error processing route {i}: {e}")
                 continue
 
+        route_token = uuid4().hex
+        route_store.set(route_token, {
+            'directions': pruned_routes,
+            'source': source_coords,
+            'destination': dest_coords,
+            'vehicle': vehicle
+        }, expire=ROUTE_STORE_TTL)
+        session['route_token'] = route_token
+
         return render_template("route_select.html", routes=routes)
     
     except Exception as e:
@@ -501,85 +734,90 @@ def fetch_routes():
 @app.route('/analyze_route', methods=['POST'])
 def analyze_route():
     try:
-        directions = session.get('directions')
+        route_entry = route_store.get(session.get('route_token'))
+        directions = route_entry['directions'] if route_entry else None
         index = int(request.form['route_index'])
 
-        if not directions or index >= len(directions):
+        if not directions or index >= len(directions) or directions[index] is None:
             return "Invalid route selected or session data expired. Please start over."
 
         selected = directions[index]
         steps = selected['legs'][0]['steps']
-        coords = polyline.decode(selected['overview_polyline']['points'])
-        source = session['source']
-        destination = session['destination']
+        source = route_entry['source']
+        destination = route_entry['destination']
         
         total_distance = selected['legs'][0]['distance']['text']
         total_duration = selected['legs'][0]['duration']['text']
 
-        detailed_coords = interpolate_route_points(coords, points_per_km=10)
+        # The decoded and interpolated route is kept with the token, so re-analysing the same route skips that work
+        route_coords = route_entry.setdefault('route_coords', {})
+        if index not in route_coords:
+            coords = simplify_route(polyline.decode(selected['overview_polyline']['points']))
+            route_coords[index] = np.asarray(interpolate_route_points(coords, points_per_km=10), dtype=np.float64).reshape(-1, 2)
+            route_store.set(session['route_token'], route_entry, expire=ROUTE_STORE_TTL)
+        route_points = route_coords[index]
         
         segments = get_route_segments(steps)
 
-        def get_pois(keyword):
-            pois = []
+        def get_places(task):
+            lat, lng, keyword = task
             try:
-                for lat, lng in detailed_coords[::50]:
-                    places = gmaps.places_nearby(location=(lat, lng), radius=200, keyword=keyword)
-                    for place in places.get('results', []):
-                        pois.append({
-                            'name': place['name'],
-                            'location': (place['geometry']['location']['lat'], place['geometry']['location']['lng']),
-                            'type': keyword
-                        })
+                return cached_places(lat, lng, 200, keyword).get('results', [])
             except Exception as e:
-                print(f"Error getting places for {keyword}: {e}")
-            return pois
+                print(f"Error getting places for {keyword} at ({lat}, {lng}): {e}")
+                return []
 
+        tasks = [(lat, lng, keyword) for keyword in POI_KEYWORDS for lat, lng in route_points[::50].tolist()]
+        with ThreadPoolExecutor(max_workers=PLACES_WORKERS) as executor:
+            results = list(executor.map(get_places, tasks))
+
+        # Neighbouring sample points return overlapping results, keep each place once per keyword
         all_pois = []
-        for keyword in ['hospital', 'police', 'fuel', 'school']:
-            all_pois.extend(get_pois(keyword))
+        seen_places = set()
+        for (lat, lng, keyword), places in zip(tasks, results):
+            try:
+                for place in places:
+                    location = place['geometry']['location']
+                    key = (place.get('place_id') or (location['lat'], location['lng']), keyword)
+                    if key in seen_places:
+                        continue
+                    seen_places.add(key)
+                    all_pois.append((location['lat'], location['lng'], keyword, place['name']))
+            except Exception as e:
+                print(f"Error reading places for {keyword} at ({lat}, {lng}): {e}")
+        all_pois = build_poi_store(all_pois)
 
-        traffic_data = get_traffic_data(detailed_coords)
-        risk_zones = identify_high_risk_zones(detailed_coords, all_pois, segments, traffic_data)
-        route_report = generate_route_report(detailed_coords, all_pois, risk_zones, traffic_data, total_distance, total_duration, segments)
+        traffic_data, traffic_summary = get_traffic_data(route_points)
+        risk_zones, risk_counts = identify_high_risk_zones(route_points, all_pois, segments, traffic_data)
+        route_report = generate_route_report(route_points, all_pois, risk_counts, traffic_summary, total_distance, total_duration, segments)
 
         m = folium.Map(location=source, zoom_start=13)
         
         folium.Marker(source, popup='Start', icon=folium.Icon(color='green', icon='flag', prefix='fa')).add_to(m)
         folium.Marker(destination, popup='End', icon=folium.Icon(color='black', icon='flag-checkered', prefix='fa')).add_to(m)
         
-        folium.PolyLine(detailed_coords, color='blue', weight=4, opacity=0.8).add_to(m)
+        # Interpolated points are collinear, so the drawn line and the markers use a simplified copy
+        m.add_child(route_line(route_points[rdp_mask(route_points, ROUTE_LINE_EPSILON_DEG)]))
         
-        # Adding truck markers at intervals
-        for i in range(1, len(detailed_coords) - 1, 50): # Every 50 points
-            try:
-                current_coord = detailed_coords[i]
-                prev_coord = detailed_coords[i-1]
-                next_coord = detailed_coords[i+1]
-                prev_bearing = calculate_bearing(prev_coord[0], prev_coord[1], current_coord[0], current_coord[1])
-                next_bearing = calculate_bearing(current_coord[0], current_coord[1], next_coord[0], next_coord[1])
-                turn_angle = calculate_turn_angle(prev_bearing, next_bearing)
-                recommended_speed = get_recommended_speed(turn_angle)
-
-                truck_html = f"""
-                <div style='text-align: center; font-family: Arial;'>
-                    <div style='font-size: 20px;'>🚛</div>
-                    <div style='background-color: {"red" if recommended_speed < 30 else "orange" if recommended_speed < 45 else "green"};
-                                color: white; padding: 2px 5px; border-radius: 3px; font-weight: bold;'>
-                        {recommended_speed} km/h
-                    </div>
-                    <div style='font-size: 10px; margin-top: 2px;'>
-                        Turn: {turn_angle:.1f}°
-                    </div>
-                </div>
-                """
-                folium.Marker(
-                    location=current_coord,
-                    popup=folium.IFrame(truck_html, width=120, height=80),
-                    icon=folium.DivIcon(html=truck_html, icon_size=(60, 60), icon_anchor=(30, 30))
-                ).add_to(m)
-            except Exception as e:
-                print(f"Error adding truck marker at {i}: {e}")
+        # Map overlays are emitted as one GeoJSON layer each; the JS factories above build the markers client-side
+        # Adding truck markers: the vertices of the simplified route are the candidates, and only those that call for slowing down get one
+        turn_points = route_points[rdp_mask(route_points, RDP_EPSILON_DEG)]
+        turn_angles, speeds = compute_speeds(route_geom(turn_points))
+        marked = np.flatnonzero(speeds[1:-1] < MAX_SPEED_LIMIT) + 1
+        # Capped at the original marker density, keeping the sharpest turns in route order
+        max_markers = len(range(1, len(route_points) - 1, TRUCK_MARKER_STRIDE))
+        if len(marked) > max_markers:
+            marked = np.sort(marked[np.argsort(-turn_angles[marked], kind='stable')[:max_markers]])
+        truck_markers = []
+        for lat, lng, turn_angle, recommended_speed in zip(
+                turn_points[marked, 0].tolist(), turn_points[marked, 1].tolist(), turn_angles[marked].tolist(), speeds[marked].tolist()):
+            truck_html = TRUCK_HTML.substitute(
+                color="red" if recommended_speed < 30 else "orange" if recommended_speed < 45 else "green",
+                speed=recommended_speed,
+                turn=f"{turn_angle:.1f}"
+            )
+            truck_markers.append((lat, lng, {'recommended_speed': recommended_speed, 'html': truck_html}))
+        folium.GeoJson(point_features(truck_markers), name='Truck speeds', pointToLayer=TRUCK_MARKER_JS).add_to(m)
 
         # Adding POI markers
         marker_styles = {
@@ -588,102 +826,58 @@ def analyze_route():
             'fuel': {'color': 'orange', 'icon': 'gas-pump'},
             'school': {'color': 'purple', 'icon': 'school'}
         }
-        for poi in all_pois:
-            try:
-                props = marker_styles.get(poi['type'], {'color': 'gray', 'icon': 'info-circle'})
-                icon = folium.Icon(color=props['color'], icon=props['icon'], prefix='fa')
-                folium.Marker(location=poi['location'], popup=f"<b>{poi['name']}</b><br>{poi['type'].capitalize()}", icon=icon).add_to(m)
-            except Exception as e:
-                print(f"Error adding POI marker: {e}")
+        poi_markers = []
+        for lat, lng, type_id, name in zip(all_pois.lat.tolist(), all_pois.lng.tolist(), all_pois.type_id.tolist(), all_pois.names):
+            poi_type = POI_KEYWORDS[type_id]
+            props = marker_styles.get(poi_type, {'color': 'gray', 'icon': 'info-circle'})
+            popup = f"<b>{name}</b><br>{poi_type.capitalize()}"
+            poi_markers.append((lat, lng, {'color': props['color'], 'icon': props['icon'], 'popup': popup}))
+        folium.GeoJson(point_features(poi_markers), name='Points of interest', pointToLayer=POI_MARKER_JS).add_to(m)
 
         # Adding risk zones
-        for zone in risk_zones:
-            try:
-                color = 'red' if zone['risk_level'] == 'High' else 'orange'
-                risk_popup = folium.Popup(f"""
-                <div style='font-family: Arial; max-width: 200px;'>
-                    <h4 style='color: {color};'>⚠️ {zone['risk_level']} Risk Zone</h4>
-                    <p><b>Risk Score:</b> {zone['risk_score']:.1f}/10</p>
-                    <p><b>Factors:</b><br>{'<br>'.join(zone['risk_factors'])}</p>
-                </div>
-                """, max_width=250)
-                folium.CircleMarker(
-                    location=zone['location'],
-                    radius=15,
-                    popup=risk_popup,
-                    color=color,
-                    fillColor=color,
-                    fillOpacity=0.4
-                ).add_to(m)
-            except Exception as e:
-                print(f"Error adding risk zone: {e}")
+        risk_colors = ['red' if level == 'High' else 'orange' for level in risk_zones['risk_level'].tolist()]
+        risk_markers = [
+            (lat, lng, {'color': color, 'popup': RISK_POPUP_HTML.substitute(
+                color=color, level=level, score=f"{score:.1f}", factors='<br>'.join(factors))})
+            for lat, lng, score, level, factors, color in zip(
+                risk_zones['lat'].tolist(), risk_zones['lng'].tolist(), risk_zones['risk_score'].tolist(),
+                risk_zones['risk_level'].tolist(), risk_zones['risk_factors'].tolist(), risk_colors)
+        ]
+        folium.GeoJson(point_features(risk_markers), name='Risk zones', pointToLayer=RISK_ZONE_JS).add_to(m)
 
         # Adding traffic indicators
-        for traffic in traffic_data:
-            try:
-                color = {'light': 'green', 'moderate': 'orange', 'heavy': 'red'}[traffic['traffic_level']]
-                folium.Circle(
-                    location=traffic['location'],
-                    radius=100,
-                    color=color,
-                    fill=True,
-                    fillColor=color,
-                    fillOpacity=0.2,
-                    popup=f"Traffic: {traffic['traffic_level'].title()}<br>Delay: {traffic['delay_factor']:.1f}x"
-                ).add_to(m)
-            except Exception as e:
-                print(f"Error adding traffic indicator: {e}")
+        traffic_markers = [
+            (lat, lng, {
+                'color': TRAFFIC_COLORS[TRAFFIC_LEVELS[level_code]],
+                'popup': f"Traffic: {TRAFFIC_LEVELS[level_code].title()}<br>Delay: {delay_factor:.1f}x"
+            })
+            for lat, lng, level_code, delay_factor in zip(
+                traffic_data.lat.tolist(), traffic_data.lng.tolist(), traffic_data.level_code.tolist(), traffic_data.delay_factor.tolist())
+        ]
+        folium.GeoJson(point_features(traffic_markers), name='Traffic', pointToLayer=TRAFFIC_MARKER_JS).add_to(m)
 
         # Add the legend
-        legend_html = f"""
-        {{% macro html(this, kwargs) %}}
-        <div style="
-            position: fixed;
-            bottom: 50px;
-            left: 50px;
-            width: 280px;
-            background-color: white;
-            border: 2px solid grey;
-            border-radius: 8px;
-            z-index: 9999;
-            padding: 15px;
-            font-size: 12px;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-        ">
-            <h4 style='margin-top: 0; color: #333;'>🚛 Truck Navigation Legend</h4>
-            <div style='margin: 5px 0;'><i class="fa fa-plus fa-lg" style="color:red"></i> Hospital</div>
-            <div style='margin: 5px 0;'><i class="fa fa-shield fa-lg" style="color:blue"></i> Police</div>
-            <div style='margin: 5px 0;'><i class="fa fa-gas-pump fa-lg" style="color:orange"></i> Fuel Station</div>
-            <div style='margin: 5px 0;'>🔴 High Risk Zone</div>
-            <div style='margin: 5px 0;'>🟡 Medium Risk Zone</div>
-            <div style='margin: 5px 0;'>● Traffic: <span style='color: green;'>Light</span> <span style='color: orange;'>Moderate</span> <span style='color: red;'>Heavy</span></div>
-            <hr style='margin: 10px 0;'>
-            <div style='font-size: 10px; color: #666;'>
-                Max Weight: {TRUCK_WEIGHT}T | Speed Limit: {MAX_SPEED_LIMIT} km/h
-            </div>
-        </div>
-        {{% endmacro %}}
-        """
-        
         legend = MacroElement()
-        legend._template = Template(legend_html)
+        legend._template = LEGEND_TEMPLATE
         m.get_root().add_child(legend)
 
         unique_map_id = uuid4().hex
         html_name = f"route_map_{unique_map_id}.html"
-        m.save(f"templates/{html_name}")
+        save_map(m, html_name)
 
         session['route_report'] = route_report
         session.modified = True
 
+        turn_count = len(TURN_RE.findall('\n'.join(s['html_instructions'] for s in steps)))
+
         return render_template("route_analysis.html",
-                               mode=session['vehicle'],
-                               turns=sum("turn" in s['html_instructions'].lower() for s in steps),
-                               poi_count=len(all_pois),
+                               mode=route_entry['vehicle'],
+                               turns=turn_count,
+                               poi_count=len(all_pois.names),
                                html_file=html_name,
                                route_report=route_report,
                                risk_zones=len(risk_zones),
-                               high_risk_zones=len([z for z in risk_zones if z['risk_level'] == 'High']))
+                               high_risk_zones=risk_counts['High'])
 
     except Exception as e:
         print(f"Error in analyze_route: {e}")
@@ -705,11 +899,11 @@ def detailed_report():
 @app.route('/view_map/<filename>')
 def view_map(filename):
     try:
-        path = os.path.join("templates", filename)
+        path = os.path.join("templates", filename + ".gz")
         if not os.path.exists(path):
             return "Map file not found", 404
-        response = make_response(render_template(filename))
-        response.headers['Cache-Control'] = 'no-store'
+        response = send_map(filename)
+        response.headers['Cache-Control'] = 'no-cache'
         return response
     except Exception as e:
         print(f"Error viewing map: {e}")
@@ -718,7 +912,7 @@ def view_map(filename):
 @app.route('/download/<filename>')
 def download_map(filename):
     try:
-        return send_from_directory(directory='templates', path=filename, as_attachment=True)
+        return send_map(filename, as_attachment=True)
     except Exception as e:
         print(f"Error downloading map: {e}")
         return f"Error downloading file: {str(e)}", 500
@@ -726,10 +920,10 @@ def download_map(filename):
 @app.route('/preview/<filename>')
 def view_preview(filename):
     try:
-        path = os.path.join("templates", filename)
+        path = os.path.join("templates", filename + ".gz")
         if not os.path.exists(path):
             return "Preview not found.", 404
-        response = make_response(render_template(filename))
+        response = send_map(filename)
         response.headers['Cache-Control'] = 'no-store'
         return response
     except Exception as e:
@@ -0,0 +1,121 @@
+import math
+from collections import namedtuple
+import numpy as np
+from numba import njit
+from scipy.spatial import cKDTree
+
+MAX_SPEED_LIMIT = 60  # kmph
+EARTH_RADIUS_M = 6371000.0
+
+# Per-point trig shared by the array kernels below, so it is evaluated once per set of points
+RouteGeom = namedtuple('RouteGeom', 'lat_rad lng_rad sin_lat cos_lat')
+
+def route_geom(points):
+    """Builds the RouteGeom of an (N, 2) array of lat/lng degrees."""
+    lat_rad = np.radians(points[:, 0])
+    return RouteGeom(lat_rad, np.radians(points[:, 1]), np.sin(lat_rad), np.cos(lat_rad))
+
+# Recommended speed steps: up to 20° of turn keeps the limit, then 35, 20 and 10 km/h past 20°, 45° and 90°
+SPEED_THRESHOLDS = np.array([20.0, 45.0, 90.0])
+SPEED_STEPS = np.array([MAX_SPEED_LIMIT, 35, 20, 10], dtype=np.int32)
+
+def recommended_speeds(turn_angles):
+    """
+    Calculates a recommended speed (km/h) for every turn angle in an array.
+    This is a heuristic model, not a physical simulation.
+    """
+    return SPEED_STEPS[np.digitize(turn_angles, SPEED_THRESHOLDS, right=True)]
+
+def bearings_and_turns(geom):
+    """
+    Computes, for every point of a polyline given as a RouteGeom, the bearing of the incoming leg and the turn angle.
+    Every leg bearing is computed once in a single NumPy pass.
+    The end points have no turn and are left at 0.
+    """
+    sin_lat, cos_lat = geom.sin_lat, geom.cos_lat
+    dlng = np.diff(geom.lng_rad)
+    y = np.sin(dlng) * cos_lat[1:]
+    x = cos_lat[:-1] * sin_lat[1:] - sin_lat[:-1] * cos_lat[1:] * np.cos(dlng)
+    bearings = (np.degrees(np.arctan2(y, x)) + 360) % 360
+    turn = np.abs(np.diff(bearings))
+    bearing_prev = np.zeros(len(sin_lat))
+    turn_angle = np.zeros(len(sin_lat))
+    bearing_prev[1:-1] = bearings[:-1]
+    turn_angle[1:-1] = np.minimum(turn, 360 - turn)
+    return bearing_prev, turn_angle
+
+def compute_speeds(geom):
+    """
+    Computes the turn angle and the recommended speed (km/h) at every point of a polyline given as a RouteGeom.
+    The end points have no turn and get the maximum speed.
+    """
+    _, turn_angle = bearings_and_turns(geom)
+    return turn_angle, recommended_speeds(turn_angle)
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance in meters between points given in degrees.
+    Works element-wise on NumPy arrays as well as on scalars.
+    """
+    lat1, lng1, lat2, lng2 = np.radians(lat1), np.radians(lng1), np.radians(lat2), np.radians(lng2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+def to_cartesian_m(geom):
+    """
+    Projects the points of a RouteGeom onto Earth-centred x/y/z coordinates in meters.
+    Straight-line distances there match great-circle distances at the few-hundred-meter scale.
+    """
+    cos_lat = geom.cos_lat
+    return EARTH_RADIUS_M * np.column_stack([cos_lat * np.cos(geom.lng_rad), cos_lat * np.sin(geom.lng_rad), geom.sin_lat])
+
+def proximity_within(point_tree, targets, radius_m):
+    """
+    For every point in point_tree, counts the targets closer than radius_m and sums their proximity factors (1 - d / radius_m).
+    point_tree is a cKDTree over to_cartesian_m coordinates so it can be shared between target sets;
+    targets are to_cartesian_m coordinates as well.
+    """
+    if point_tree.n == 0 or len(targets) == 0:
+        return np.zeros(point_tree.n, dtype=np.int64), np.zeros(point_tree.n)
+    pairs = point_tree.sparse_distance_matrix(cKDTree(targets), radius_m, output_type='ndarray')
+    counts = np.bincount(pairs['i'], minlength=point_tree.n)
+    closeness = np.bincount(pairs['i'], weights=1 - pairs['v'] / radius_m, minlength=point_tree.n)
+    return counts, closeness
+
+@njit(cache=True)
+def rdp_mask(points, epsilon):
+    """
+    Ramer-Douglas-Peucker simplification of an (N, 2) array of points.
+    Returns a boolean mask of the points to keep; epsilon is in the same units as the points.
+    """
+    n = points.shape[0]
+    keep = np.zeros(n, dtype=np.bool_)
+    if n == 0:
+        return keep
+    keep[0] = True
+    keep[n - 1] = True
+    stack = [(0, n - 1)]
+    while len(stack) > 0:
+        start, end = stack.pop()
+        x0 = points[start, 0]
+        y0 = points[start, 1]
+        dx = points[end, 0] - x0
+        dy = points[end, 1] - y0
+        seg_len = math.sqrt(dx * dx + dy * dy)
+        max_dist = 0.0
+        index = start
+        for i in range(start + 1, end):
+            px = points[i, 0] - x0
+            py = points[i, 1] - y0
+            if seg_len > 0:
+                dist = abs(px * dy - py * dx) / seg_len
+            else:
+                dist = math.sqrt(px * px + py * py)
+            if dist > max_dist:
+                max_dist = dist
+                index = i
+        if max_dist > epsilon:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return keep